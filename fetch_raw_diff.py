@@ -1,61 +1,79 @@
 import os
 import re
+import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 # from bs4 import BeautifulSoup
 # from util import language_tool
 
-def parse_diff(file_name, diff):
-    parts = re.split('(@@.*?-.*?\+.*?@@)', diff)
-    start_with_plus_regex = re.compile('^\++')
-    start_with_minus_regex = re.compile('^\-+')
+logger = logging.getLogger(__name__)
+
+_HUNK_RE = re.compile(r'(@@.*?-.*?\+.*?@@)')
+_HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+_FILE_RE = re.compile(r'a/.*? b/(.*?)\n')
+_DIFF_RE = re.compile(r'diff --git')
+
+# shared across calls so repeated fetches reuse warm TLS connections
+_SESSION = requests.Session()
+_SESSION.mount('https://github.com', HTTPAdapter(
+    pool_connections=32, pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3)))
+
+def iter_sections(regex, text):
+    """ Yield (header, body) pairs for every match of regex in text, where
+    body is the text up to the next match. Same pieces as regex.split(text),
+    but sliced lazily instead of materializing the whole list up front.
+    """
+    prev = None
+    for m in regex.finditer(text):
+        if prev is not None:
+            yield prev.group(0), text[prev.end():m.start()]
+        prev = m
+    if prev is not None:
+        yield prev.group(0), text[prev.end():]
 
-    add_diff_code = ""
-    del_diff_code = ""
+def parse_diff(file_name, diff):
+    add_diff_chunks = []
+    del_diff_chunks = []
     add_code_line = 0
     del_code_line = 0
     add_location_set = []
     del_location_set = []
 
-    parts_len = len(parts)
-    for i in range(1, parts_len, 2):
-        location = parts[i]
-        part = parts[i + 1]
+    for location, part in iter_sections(_HUNK_RE, diff):
         
-        try:
-            add, dele = location.replace('@','').strip().split(' ')
-        except:
+        m = _HUNK_HEADER_RE.match(location)
+        if not m:
             continue
         
         if len(part) >= 100 * 1024:
             continue
         
         try:
-            if ('-' in add) and ('+' in dele):
-                add, dele = dele, add
-
-            if ',' in add:
-                add_location, add_line = add[1:].split(',')
-            else:
-                add_location = 0
-                add_line = add[1:]
-
-            if ',' in dele:
-                del_location, del_line = dele[1:].split(',')
-            else:
-                del_location = 0
-                del_line = dele[1:]
-
-            lines_of_code = [x.strip() for x in part.splitlines()]
-
-            added_lines_of_code = filter(lambda x: (x) and (x[0] == '+'), lines_of_code)
-            added_lines_of_code = [start_with_plus_regex.sub('', x) for x in added_lines_of_code]
-
-            deleted_lines_of_code = filter(lambda x: (x) and (x[0] == '-'), lines_of_code)
-            deleted_lines_of_code = [start_with_minus_regex.sub('', x) for x in deleted_lines_of_code]
-
-            add_diff_code += '\n'.join(added_lines_of_code) + '\n'
-            del_diff_code += '\n'.join(deleted_lines_of_code) + '\n'
+            del_location, del_line, add_location, add_line = m.groups()
+            # a hunk header without ",count" is recorded as [0, start]
+            if add_line is None:
+                add_location, add_line = 0, add_location
+            if del_line is None:
+                del_location, del_line = 0, del_location
+
+            added_lines_of_code = []
+            deleted_lines_of_code = []
+            for line in part.splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                if line[0] == '+':
+                    added_lines_of_code.append(line.lstrip('+'))
+                elif line[0] == '-':
+                    deleted_lines_of_code.append(line.lstrip('-'))
+
+            add_diff_chunks.append('\n'.join(added_lines_of_code))
+            add_diff_chunks.append('\n')
+            del_diff_chunks.append('\n'.join(deleted_lines_of_code))
+            del_diff_chunks.append('\n')
 
             add_code_line += len(added_lines_of_code)
             del_code_line += len(deleted_lines_of_code)
@@ -63,7 +81,7 @@ def parse_diff(file_name, diff):
             add_location_set.append([int(add_location), int(add_line)])
             del_location_set.append([int(del_location), int(del_line)])
         except Exception as e:
-            print('Parse Error:', e)
+            logger.debug('Parse Error: %s', e)
     
     return {"name": file_name, 
             "LOC": {
@@ -74,27 +92,23 @@ def parse_diff(file_name, diff):
                 "add": add_location_set,
                 "del": del_location_set,
              },
-            "add_code": add_diff_code,
-            "del_code": del_diff_code,
+            "add_code": ''.join(add_diff_chunks),
+            "del_code": ''.join(del_diff_chunks),
            }
 
 def parse_files(r):
     file_list = []
-    diff_list = r.split('diff --git')
-    for diff in diff_list[1:]:
+    for _, diff in iter_sections(_DIFF_RE, r):
         try:
-            file_full_name = re.findall('a\/.*? b\/(.*?)\n', diff)[0]
+            file_full_name = _FILE_RE.search(diff).group(1)
         except:
             continue
         file_list.append(parse_diff(file_full_name, diff))
     return file_list
 
 def fetch_raw_diff(url):
-    s = requests.Session()
-    s.mount('https://github.com', HTTPAdapter(max_retries=3))
-
     try:
-        r = s.get(url, timeout=120)
+        r = _SESSION.get(url, timeout=120)
         if r.status_code != requests.codes.ok:
             raise Exception('error on fetch compare page on %s!' % url)
     except:
@@ -102,6 +116,13 @@ def fetch_raw_diff(url):
 
     return parse_files(r.text)
 
+def fetch_raw_diffs(urls, max_workers=8):
+    """ Fetch and parse several raw diffs concurrently over the shared session.
+    Results are returned in the same order as urls.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(fetch_raw_diff, urls))
+
 if __name__ == '__main__':
     # print(fetch_raw_diff('https://github.com/MarlinFirmware/Marlin/commit/6b43bfa01dd76f5475acf40d0e5b5f240fe57d9e'))
     # print([x["location"] for x in fetch_raw_diff('https://github.com/mozilla-b2g/gaia/pull/34385.diff')])
@@ -1,16 +1,51 @@
+import re
+import copy
 import time
 from datetime import datetime
 import json
+import itertools
+import threading
 from typing import Iterable
 from random import randint
 import os.path
+from functools import lru_cache
+from pathlib import Path
 from util import language_tool
-import fetch_raw_diff
 import logging
-import os.path
 import init
-from fetch_raw_diff import *
+import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from util import localfile
+from util import response_cache
+from util.shelf_cache import ShelfCache
+
+try:
+    # optional, decodes large paginated payloads several times faster
+    from orjson import loads as json_loads, dumps as json_dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+# fetch_raw_diff (and the github.com session it sets up) is only imported
+# once a diff actually has to be parsed or fetched
+_FETCH_RAW_DIFF_NAMES = ('fetch_raw_diff', 'fetch_raw_diffs', 'parse_files',
+                         'iter_sections')
+
+
+def __getattr__(name):
+    if name in _FETCH_RAW_DIFF_NAMES:
+        import fetch_raw_diff
+        return getattr(fetch_raw_diff, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def parse_diff(file_name, diff):
+    from fetch_raw_diff import parse_diff
+    return parse_diff(file_name, diff)
 
 # try:
 #     import settings
@@ -20,20 +55,74 @@ from util import localfile
 # _tokens = getattr(settings, "SCRAPER_GITHUB_API_TOKENS", [])
 
 with open(init.currentDIR+"/data/token.txt", 'r') as file:
-    _tokens = [line.rstrip('\n') for line in file]
-
-logger = logging.getLogger('ghd.scraper')
+    _tokens = tuple(line.rstrip('\n') for line in file)
 
 LOCAL_DATA_PATH = init.LOCAL_DATA_PATH
-file_list_cache = {}
 
 
+@lru_cache(maxsize=200000)
+def pr_dir(repo, num):
+    # type: (str, int) -> Path
+    """ LOCAL_DATA_PATH/pr_data/<repo>/<num>, where the files fetched for
+    one PR are kept """
+    return Path(LOCAL_DATA_PATH, 'pr_data', repo, str(num))
 
 
+def _mtime(path):
+    # stamp for ShelfCache entries derived from path, None while it is missing
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+# persisted across runs, keyed by (repo, pr_id) and stamped with the mtimes
+# of the files the value was computed from
+file_list_cache = ShelfCache(LOCAL_DATA_PATH + '/cache/file_list')
 
 logger = logging.getLogger('INTRUDE.scraper')
 # nonCodeFileExtensionList = [line.rstrip('\n') for line in open('./data/NonCodeFile.txt')]
-nonCodeFileExtensionList = [line.rstrip('\n') for line in open(init.currentDIR+'/data/NonCodeFile.txt')]
+with open(init.currentDIR+'/data/NonCodeFile.txt') as file:
+    nonCodeFileExtensionList = frozenset(line.rstrip('\n') for line in file)
+# str.endswith takes a tuple and checks all suffixes in one call
+nonCodeFileSuffixes = tuple(nonCodeFileExtensionList)
+
+# How GitHubAPI.request reacts to a non-success status:
+# (action, max random sleep in seconds, log level, message). 'return' gives
+# up with an empty result, 'skip' tries the next token, 'sleep' backs off and
+# retries.
+# 404/451: API v3 only, could raise RepoDoesNotExist instead
+# 409/410: repository is empty https://developer.github.com/v3/git/
+STATUS_ACTIONS = {
+    404: ('return', None, logging.DEBUG, "404, 451 retry.."),
+    451: ('return', None, logging.DEBUG, "404, 451 retry.."),
+    409: ('return', None, logging.DEBUG, "409 retry.."),
+    410: ('return', None, logging.DEBUG, "410 retry.."),
+    401: ('skip', None, logging.ERROR,
+          "401,Bad credentials, please remove this token"),
+    403: ('sleep', 60, logging.INFO, "403 retry.."),
+    443: ('sleep', 29, logging.INFO, "443 retry.."),
+    # reached once the adapter's own retries (GitHubAPI.__init__) gave up
+    500: ('sleep', 29, logging.INFO, "500 retry.."),
+    502: ('sleep', 29, logging.INFO, "502 retry.."),
+}
+
+
+_LINK_RE = re.compile(r'<([^>]+)>;\s*rel="(\w+)"')
+_PAGE_RE = re.compile(r'[?&]page=(\d+)')
+# "#123", ".../pull/123" and ".../issues/123" cross references
+_REFS_RE = re.compile(r'#([0-9]+)|pull/([0-9]+)|issues/([0-9]+)')
+_VERSION_RE = re.compile(r'(?:\d+\.)?\d+\.\d+')
+
+
+def _last_page(link):
+    # page number of rel="last" in a Link header, or None
+    for link_url, rel in _LINK_RE.findall(link):
+        if rel == 'last':
+            m = _PAGE_RE.search(link_url)
+            return int(m.group(1)) if m else None
+    return None
+
 
 class RepoDoesNotExist(requests.HTTPError):
     pass
@@ -59,6 +148,110 @@ def parse_commit(commit):
     }
 
 
+def _timeline_row(event, **fields):
+    # every timeline row has the same columns; unknown events keep them empty
+    row = {
+        'event': event['event'],
+        'author': '',
+        'email': '',
+        'author_type': '',
+        'author_association': '',
+        'commit_id': '',
+        'created_at': event.get('created_at'),
+        'id': '',
+        'repo': '',
+        'type': '',
+        'state': '',
+        'assignees': '',
+        'label': '',
+        'body': ''
+    }
+    row.update(fields)
+    return row
+
+
+def _actor(event):
+    author = event['actor'] or {}
+    return {'author': author.get('login'), 'author_type': author.get('type')}
+
+
+def _timeline_cross_referenced(event):
+    issue = event['source']['issue']
+    return _timeline_row(
+        event, id=issue['number'],
+        repo=issue['repository']['full_name'],
+        type='pull_request' if 'pull_request' in issue.keys() else 'issue',
+        state=issue['state'], assignees=issue['assignees'], **_actor(event))
+
+
+def _timeline_referenced(event):
+    return _timeline_row(event, commit_id=event['commit_id'],
+                         created_at=event['created_at'], type='commit',
+                         **_actor(event))
+
+
+def _timeline_labeled(event):
+    return _timeline_row(event, type='label', label=event['label']['name'],
+                         **_actor(event))
+
+
+def _timeline_committed(event):
+    return _timeline_row(event, author=event['author']['name'],
+                         email=event['author']['email'],
+                         commit_id=event['sha'], type='commit')
+
+
+def _timeline_reviewed(event):
+    author = event['user'] or {}
+    return _timeline_row(event, author=author.get('login'),
+                         author_type=author.get('type'),
+                         author_association=event['author_association'],
+                         type='review', state=event['state'])
+
+
+def _timeline_commented(event):
+    return _timeline_row(event, author=event['user']['login'],
+                         author_type=event['user']['type'],
+                         author_association=event['author_association'],
+                         type='comment', body=event['body'])
+
+
+def _timeline_assigned(event):
+    return _timeline_row(event, type='comment', **_actor(event))
+
+
+def _timeline_closed(event):
+    return _timeline_row(event, commit_id=event['commit_id'], type='close',
+                         **_actor(event))
+
+
+def _timeline_subscribed(event):
+    return _timeline_row(event, commit_id=event['commit_id'],
+                         id=event['commit_id'], type='subscribed',
+                         **_actor(event))
+
+
+def _timeline_merged(event):
+    return _timeline_row(event, commit_id=event['commit_id'],
+                         id=event['commit_id'], type='merged',
+                         **_actor(event))
+
+
+# event name -> function building the row GitHubAPI.issue_pr_timeline yields
+TIMELINE_HANDLERS = {
+    'cross-referenced': _timeline_cross_referenced,
+    'referenced': _timeline_referenced,
+    'labeled': _timeline_labeled,
+    'committed': _timeline_committed,
+    'reviewed': _timeline_reviewed,
+    'commented': _timeline_commented,
+    'assigned': _timeline_assigned,
+    'closed': _timeline_closed,
+    'subscribed': _timeline_subscribed,
+    'merged': _timeline_merged,
+}
+
+
 class GitHubAPIToken(object):
     api_url = "https://api.github.com/"
 
@@ -69,6 +262,10 @@ class GitHubAPIToken(object):
 
     limit = None  # see __init__ for more details
 
+    # below these many remaining requests, spread the rest of the window
+    # evenly until reset instead of bursting into a 403 and secondary limits
+    pace_threshold = {'core': 100, 'search': 30}
+
     def __init__(self, token=None, timeout=None):
         if token is not None:
             self.token = token
@@ -83,11 +280,21 @@ class GitHubAPIToken(object):
             self.limit[api_class] = {
                 'limit': None,
                 'remaining': None,
-                'reset_time': None
+                'reset_time': None,
+                'next_time': 0
             }
         self.timeout = timeout
+        self._url_prefix = self.api_url  # instance lookup in request()
+        # keep-alive connections to api.github.com are reused across requests;
+        # GitHubAPI mounts the connection pool all its tokens share
+        self._session = requests.Session()
+        if self._headers:
+            self._session.headers.update(self._headers)
         super(GitHubAPIToken, self).__init__()
 
+    def close(self):
+        self._session.close()
+
     @property
     def user(self):
         if self._user is None:
@@ -99,21 +306,6 @@ class GitHubAPIToken(object):
                 self._user = r.json().get('login', '')
         return self._user
 
-    def _check_limits(self):
-        # regular limits will be updaated automatically upon request
-        # we only need to take care about search limit
-        try:
-            s = self.request('rate_limit').json()['resources']['search']
-        except TokenNotReady:
-            # self.request updated core limits already; search limits unknown
-            s = {'remaining': None, 'reset': None, 'limit': None}
-
-        self.limit['search'] = {
-            'remaining': s['remaining'],
-            'reset_time': s['reset'],
-            'limit': s['limit']
-        }
-
     @staticmethod
     def api_class(url):
         return 'search' if url.startswith('search') else 'core'
@@ -123,17 +315,24 @@ class GitHubAPIToken(object):
         return not t or t <= time.time()
 
     def legit(self):
-        if self.limit['core']['limit'] is None:
-            self._check_limits()
-        return self.limit['core']['limit'] < 100
+        # core limits come with every response, no need to probe rate_limit
+        limit = self.limit['core']['limit']
+        return limit is not None and limit < 100
 
     def when(self, url):
         key = self.api_class(url)
         if self.limit[key]['remaining'] != 0:
-            return 0
+            return self.limit[key]['next_time']
         return self.limit[key]['reset_time']
 
-    def request(self, url, method='get', data=None, **params):
+    def _next_time(self, key, remaining, reset_time):
+        # earliest time of the next request so the quota lasts until reset
+        if not remaining or remaining >= self.pace_threshold[key]:
+            return 0
+        now = time.time()
+        return now + max(0, reset_time - now) / remaining
+
+    def request(self, url, method='get', data=None, headers=None, **params):
         # TODO: use coroutines, perhaps Tornado (as PY2/3 compatible)
 
         if not self.ready(url):
@@ -142,22 +341,25 @@ class GitHubAPIToken(object):
         # "Accept": "application/vnd.github.v3+json"}
 
         # might throw a timeout
-        r = requests.request(
-            method, self.api_url + url, params=params, data=data,
-            headers=self._headers, timeout=self.timeout)
+        r = self._session.request(
+            method, self._url_prefix + url, params=params, data=data,
+            headers=headers, timeout=self.timeout)
 
         if 'X-RateLimit-Remaining' in r.headers:
+            key = self.api_class(url)
             remaining = int(r.headers['X-RateLimit-Remaining'])
-            self.limit[self.api_class(url)] = {
+            reset_time = int(r.headers['X-RateLimit-Reset'])
+            self.limit[key] = {
                 'remaining': remaining,
-                'reset_time': int(r.headers['X-RateLimit-Reset']),
-                'limit': int(r.headers['X-RateLimit-Limit'])
+                'reset_time': reset_time,
+                'limit': int(r.headers['X-RateLimit-Limit']),
+                'next_time': self._next_time(key, remaining, reset_time)
             }
 
             if r.status_code == 403 and remaining == 0:
                 raise TokenNotReady
             if r.status_code == 443:
-                print('443 error')
+                logger.debug('443 error')
                 raise TokenNotReady
         return r
 
@@ -179,174 +381,237 @@ class GitHubAPI(object):
         if not tokens:
             raise EnvironmentError(
                 "No GitHub API tokens found in settings.py. Please add some.")
+        if getattr(self, '_init_args', None) == (tuple(tokens), timeout):
+            # Singleton: keep pooled connections and rate limit state
+            return
+        self._init_args = (tuple(tokens), timeout)
         self.tokens = [GitHubAPIToken(t, timeout=timeout) for t in tokens]
+        # one connection pool to api.github.com shared by all tokens, sized
+        # for request_many; 5xx responses are retried with backoff by urllib3
+        pool_size = max(16, 4 * len(self.tokens))
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size,
+            pool_block=False, max_retries=Retry(
+                total=5, backoff_factor=1.0, raise_on_status=False,
+                status_forcelist=[500, 502, 503, 504],
+                # GraphQL queries are POSTs and just as safe to repeat
+                allowed_methods=frozenset(['GET', 'POST'])))
+        for token in self.tokens:
+            token._session.mount(GitHubAPIToken.api_url, adapter)
+        # token -> sequence number of its last use, to rotate ready tokens
+        self._token_used = {t: i for i, t in enumerate(self.tokens)}
+        self._token_seq = itertools.count(len(self.tokens))
+        self._token_lock = threading.Lock()
+        # shared by all paginated requests, so concurrent page fetches never
+        # outnumber the pooled connections
+        self._page_pool = ThreadPoolExecutor(max_workers=pool_size)
+        # {request key: Future} of GET requests currently on the wire
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.cache = response_cache.ResponseCache(
+            LOCAL_DATA_PATH + '/cache/api_responses.sqlite',
+            mode=init.response_cache_mode)
+
+    def _token_rotation(self, url):
+        """ Yield tokens soonest-ready first, one pass over the pool. Among
+        equally ready tokens the least recently used comes first, so load
+        rotates across tokens instead of draining the first one in the list.
+        """
+        with self._token_lock:
+            used = dict(self._token_used)
+        order = sorted(self.tokens,
+                       key=lambda t: (t.when(url) or 0, used[t]))
+        for token in order:
+            with self._token_lock:
+                self._token_used[token] = next(self._token_seq)
+            yield token
 
     def requestPR(self, url, method='get', page=1, data=None, **params):
-        # type: (str, str, bool, str) -> dict
-        """ Generic, API version agnostic request method """
-        timeout_counter = 0
-        params['page'] = page
-        params['per_page'] = init.numPRperPage
-        while True:
-            for token in self.tokens:
-                # for token in sorted(self.tokens, key=lambda t: t.when(url)):
-                if not token.ready(url):
-                    continue
-
-                try:
-                    r = token.request(url, method=method, data=data, **params)
-                    # print(r.url)
-                except requests.ConnectionError:
-                    print('except requests.ConnectionError')
-                    continue
-                except TokenNotReady:
-                    continue
-                except requests.exceptions.Timeout:
-                    timeout_counter += 1
-                    if timeout_counter > len(self.tokens):
-                        raise
-                    continue  # i.e. try again
-
-                if r.status_code in (404, 451):
-                    print("404, 451 retry..")
-                    return {}
-                    # API v3 only
-                    # raise RepoDoesNotExist(
-                    #     "GH API returned status %s" % r.status_code)
-                elif r.status_code == 409:
-                    print("409 retry..")
-                    # repository is empty https://developer.github.com/v3/git/
-                    return {}
-                elif r.status_code == 410:
-                    print("410 retry..")
-                    # repository is empty https://developer.github.com/v3/git/
-                    return {}
-                elif r.status_code == 401:
-                    print("401,Bad credentials, please remove this token")
-                    continue
-                elif r.status_code == 403:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("403 retry..")
-                    time.sleep(randint(1, 60))
-                    continue
-                elif r.status_code == 443:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("443 retry..")
-                    time.sleep(randint(1, 29))
-                    continue
-                elif r.status_code == 502:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("443 retry..")
-                    time.sleep(randint(1, 29))
-                    continue
-                r.raise_for_status()
-                res = r.json()
-                return res
-
-            next_res = min(token.when(url) for token in self.tokens)
-            sleep = int(next_res - time.time()) + 1
-            if sleep > 0:
-                logger.info(
-                    "%s: out of keys, resuming in %d minutes, %d seconds",
-                    datetime.now().strftime("%H:%M"), *divmod(sleep, 60))
-                time.sleep(sleep)
-                logger.info(".. resumed")
-
-    def request(self, url, method='get', paginate=False, data=None, **params):
-        # type: (str, str, bool, str) -> dict
-        """ Generic, API version agnostic request method """
+        # type: (str, str, int, str) -> dict
+        """ Fetch a single page of init.numPRperPage items """
+        return self.request(url, method=method, data=data, page=page,
+                            per_page=getattr(init, 'numPRperPage', 100),
+                            **params)
+
+    def request(self, url, method='get', paginate=False, data=None,
+                per_page=None, **params):
+        # type: (str, str, bool, str, int) -> dict
+        """ Generic, API version agnostic request method.
+        Identical GET requests issued concurrently from several threads share
+        a single round-trip, and each gets its own copy of the result """
+        if method != 'get':
+            return self._request(url, method, paginate, data, per_page,
+                                 **params)
+
+        key = response_cache.ResponseCache.key(
+            url, dict(params, paginate=paginate, per_page=per_page))
+        with self._inflight_lock:
+            waiting = self._inflight.get(key)
+            if waiting is not None:
+                future = waiting[0]
+                waiting[1] += 1
+            else:
+                # [future, number of callers waiting on it]
+                self._inflight[key] = [Future(), 0]
+        if waiting is not None:
+            # every waiter gets its own copy, callers may change the result
+            return copy.deepcopy(future.result())
 
+        try:
+            res = self._request(url, method, paginate, data, per_page,
+                                **params)
+        except BaseException as e:
+            with self._inflight_lock:
+                future, _ = self._inflight.pop(key)
+            future.set_exception(e)
+            raise
+        with self._inflight_lock:
+            future, waiters = self._inflight.pop(key)
+        # waiters copy from a snapshot the owner's changes cannot reach
+        future.set_result(copy.deepcopy(res) if waiters else None)
+        return res
+
+    def _request(self, url, method, paginate, data, per_page, **params):
+        return self._request_link(url, method, paginate, data, per_page,
+                                  **params)[0]
+
+    def _request_link(self, url, method, paginate, data, per_page, **params):
+        """ _request, also returning the Link header of the last page read,
+        '' when there is none """
         timeout_counter = 0
+        if per_page is not None:
+            params['per_page'] = per_page
         if paginate:
             paginated_res = []
             params['page'] = 1
-            params['per_page'] = 100
+            params.setdefault('per_page', 100)
 
         while True:
-            for token in self.tokens:
-                # for token in sorted(self.tokens, key=lambda t: t.when(url)):
-                if not token.ready(url):
-                    continue
-
-                try:
-                    r = token.request(url, method=method, data=data, **params)
-                    # print(r.url)
-                except requests.ConnectionError:
-                    print('except requests.ConnectionError')
-                    continue
-                except TokenNotReady:
-                    continue
-                except requests.exceptions.Timeout:
-                    timeout_counter += 1
-                    if timeout_counter > len(self.tokens):
-                        raise
-                    continue  # i.e. try again
-
-                if r.status_code in (404, 451):
-                    print("404, 451 retry..")
-                    return {}
-                    # API v3 only
-                    # raise RepoDoesNotExist(
-                    #     "GH API returned status %s" % r.status_code)
-                elif r.status_code == 409:
-                    print("409 retry..")
-                    # repository is empty https://developer.github.com/v3/git/
-                    return {}
-                elif r.status_code == 410:
-                    print("410 retry..")
-                    # repository is empty https://developer.github.com/v3/git/
-                    return {}
-                elif r.status_code == 401:
-                    print("401,Bad credentials, please remove this token")
-                    continue
-                elif r.status_code == 403:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("403 retry..")
-                    time.sleep(randint(1, 60))
-                    continue
-                elif r.status_code == 443:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("443 retry..")
-                    time.sleep(randint(1, 29))
-                    continue
-                elif r.status_code == 502:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("502 retry..")
-                    time.sleep(randint(1, 29))
-                    continue
-                elif r.status_code == 500:
-                    # repository is empty https://developer.github.com/v3/git/
-                    print("500 retry..")
-                    time.sleep(randint(1, 29))
-                    continue
-                r.raise_for_status()
-                res = r.json()
+            for token in self._token_rotation(url):
+                cached = None
+                if method == 'get':
+                    cached = self.cache.get(
+                        url, params,
+                        body=self.cache.mode == response_cache.REPLAY)
+                if self.cache.mode == response_cache.REPLAY:
+                    if cached is None:
+                        # replay never goes to the network
+                        raise response_cache.NotCached(
+                            "%s %s %s is not cached" % (method, url, params))
+                    res, link = cached['body'], cached['link']
+                else:
+                    if not token.ready(url):
+                        continue
+
+                    try:
+                        r = token.request(
+                            url, method=method, data=data,
+                            headers=self.cache.conditional_headers(cached),
+                            **params)
+                        # print(r.url)
+                    except requests.ConnectionError:
+                        logger.debug('except requests.ConnectionError')
+                        continue
+                    except TokenNotReady:
+                        continue
+                    except requests.exceptions.Timeout:
+                        timeout_counter += 1
+                        if timeout_counter > len(self.tokens):
+                            raise
+                        continue  # i.e. try again
+
+                    action = STATUS_ACTIONS.get(r.status_code)
+                    if action is not None:
+                        kind, max_sleep, level, message = action
+                        logger.log(level, message)
+                        if kind == 'return':
+                            return {}, ''
+                        if kind == 'sleep':
+                            # secondary rate limits say how long to back off
+                            time.sleep(int(r.headers.get('Retry-After', 0)) or
+                                       randint(1, max_sleep))
+                        continue
+
+                    if r.status_code == 304 and cached is not None:
+                        # the stored body is only decoded when it is reused
+                        cached = self.cache.get(url, params, body=True)
+                        res, link = cached['body'], cached['link']
+                        self.cache.touch(url, params)
+                    else:
+                        r.raise_for_status()
+                        res = json_loads(r.content)
+                        link = r.headers.get("Link", "")
+                        if method == 'get':
+                            self.cache.put(url, params, r, res)
                 if paginate:
                     paginated_res.extend(res)
-                    has_next = 'rel="next"' in r.headers.get("Link", "")
+                    has_next = 'rel="next"' in link
                     if not res or not has_next:
-                        return paginated_res
+                        return paginated_res, link
+                    last_page = _last_page(link)
+                    if params["page"] == 1 and last_page:
+                        # page count is known, fetch the rest concurrently
+                        for page in self._request_pages(
+                                url, range(2, last_page + 1), method=method,
+                                data=data, **params):
+                            paginated_res.extend(page)
+                        return paginated_res, link
                     else:
                         params["page"] += 1
                         continue
                 else:
-                    return res
+                    return res, link
 
             next_res = min(token.when(url) for token in self.tokens)
             sleep = int(next_res - time.time()) + 1
             if sleep > 0:
-                logger.info(
-                    "%s: out of keys, resuming in %d minutes, %d seconds",
-                    datetime.now().strftime("%H:%M"), *divmod(sleep, 60))
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(
+                        "%s: out of keys, resuming in %d minutes, %d seconds",
+                        datetime.now().strftime("%H:%M"), *divmod(sleep, 60))
                 time.sleep(sleep)
                 logger.info(".. resumed")
 
+    def request_iter(self, url, per_page=100, **params):
+        # type: (str, int) -> Iterable[dict]
+        """ Like request(url, paginate=True), but yields items page by page
+        as they arrive instead of buffering the whole listing """
+        page = 1
+        while True:
+            res, link = self._request_link(url, 'get', False, None, per_page,
+                                           page=page, **params)
+            for item in res:
+                yield item
+            if not res or 'rel="next"' not in link:
+                return
+            page += 1
+
+    def _request_pages(self, url, pages, **params):
+        # type: (str, Iterable[int]) -> list
+        """ Fetch the given pages of url concurrently, in order """
+        def fetch(page):
+            return self.request(url, **dict(params, page=page))
+
+        return list(self._page_pool.map(fetch, pages))
+
+    def request_many(self, urls, method='get', paginate=False, **params):
+        # type: (Iterable[str], str, bool) -> list
+        """ Issue independent requests concurrently, multiplexed over all
+        tokens. Results are returned in the same order as urls.
+        """
+        def fetch(url):
+            return self.request(url, method=method, paginate=paginate,
+                                **dict(params))
+
+        with ThreadPoolExecutor(max_workers=len(self.tokens) * 4) as pool:
+            return list(pool.map(fetch, urls))
+
     def repo_issues(self, repo_name, page=None):
         # type: (str, int) -> Iterable[dict]
         url = "repos/%s/issues" % repo_name
 
         if page is None:
-            data = self.request(url, paginate=True, state='all')
+            data = self.request_iter(url, state='all')
         else:
             data = self.request(url, page=page, per_page=100, state='all')
 
@@ -364,15 +629,18 @@ class GitHubAPI(object):
 
     def repo_commits(self, repo_name):
 
-        url = "repos/%s/commits" % repo_name
+        # both listings are independent, walk their pages concurrently
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            commits = pool.submit(self.request, "repos/%s/commits" % repo_name,
+                                  paginate=True)
+            pulls = pool.submit(self.request, "repos/%s/pulls" % repo_name,
+                                paginate=True, state='all')
 
-        for commit in self.request(url, paginate=True):
+        for commit in commits.result():
             # might be None for commits authored outside of github
             yield parse_commit(commit)
 
-        url = "repos/%s/pulls" % repo_name
-
-        for pr in self.request(url, paginate=True, state='all'):
+        for pr in pulls.result():
             body = pr.get('body', {})
             head = pr.get('head', {})
             head_repo = head.get('repo') or {}
@@ -404,7 +672,7 @@ class GitHubAPI(object):
         # type: (str, int) -> Iterable[dict]
         url = "repos/%s/pulls/%d/commits" % (repo, pr_id)
 
-        for commit in self.request(url, paginate=True, state='all'):
+        for commit in self.request_iter(url, state='all'):
             yield parse_commit(commit)
 
     def issue_comments(self, repo, issue_id):
@@ -418,7 +686,7 @@ class GitHubAPI(object):
         """
         url = "repos/%s/issues/%s/comments" % (repo, issue_id)
 
-        for comment in self.request(url, paginate=True, state='all'):
+        for comment in self.request_iter(url, state='all'):
             yield {
                 'body': comment['body'],
                 'author': comment['user']['login'],
@@ -445,201 +713,8 @@ class GitHubAPI(object):
         events = self.request(url, paginate=True, state='all')
         for event in events:
             # print('repo: ' + repo + ' issue: ' + str(issue_id) + ' event: ' + event['event'])
-            if event['event'] == 'cross-referenced':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': "",
-                    'created_at': event.get('created_at'),
-                    'id': event['source']['issue']['number'],
-                    'repo': event['source']['issue']['repository']['full_name'],
-                    'type': 'pull_request' if 'pull_request' in event['source']['issue'].keys() else 'issue',
-                    'state': event['source']['issue']['state'],
-                    'assignees': event['source']['issue']['assignees'],
-                    'label': "",
-                    'body': ''
-                }
-            elif event['event'] == 'referenced':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': event['commit_id'],
-                    'created_at': event['created_at'],
-                    'id': '',
-                    'repo': '',
-                    'type': 'commit',
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            elif event['event'] == 'labeled':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': '',
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "label",
-                    'state': '',
-                    'assignees': '',
-                    'label': event['label']['name'],
-                    'body': ''
-                }
-            elif event['event'] == 'committed':
-                yield {
-                    'event': event['event'],
-                    'author': event['author']['name'],
-                    'email': event['author']['email'],
-                    'author_type': '',
-                    'author_association': '',
-                    'commit_id': event['sha'],
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "commit",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            elif event['event'] == 'reviewed':
-                author = event['user'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': event['author_association'],
-                    'commit_id': '',
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "review",
-                    'state': event['state'],
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            elif event['event'] == 'commented':
-                yield {
-                    'event': event['event'],
-                    'author': event['user']['login'],
-                    'email': '',
-                    'author_type': event['user']['type'],
-                    'author_association': event['author_association'],
-                    'commit_id': '',
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "comment",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': event['body']
-                }
-            elif event['event'] == 'assigned':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': '',
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "comment",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            elif event['event'] == 'closed':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': event['commit_id'],
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "close",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            elif event['event'] == 'subscribed':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': event['commit_id'],
-                    'created_at': event.get('created_at'),
-                    'id': event['commit_id'],
-                    'repo': '',
-                    'type': "subscribed",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            elif event['event'] == 'merged':
-                author = event['actor'] or {}
-                yield {
-                    'event': event['event'],
-                    'author': author.get('login'),
-                    'email': '',
-                    'author_type': author.get('type'),
-                    'author_association': '',
-                    'commit_id': event['commit_id'],
-                    'created_at': event.get('created_at'),
-                    'id': event['commit_id'],
-                    'repo': '',
-                    'type': "merged",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
-            else:
-                yield {
-                    'event': event['event'],
-                    'author': '',
-                    'email': '',
-                    'author_type': '',
-                    'author_association': '',
-                    'commit_id': '',
-                    'created_at': event.get('created_at'),
-                    'id': '',
-                    'repo': '',
-                    'type': "",
-                    'state': '',
-                    'assignees': '',
-                    'label': '',
-                    'body': ''
-                }
+            handler = TIMELINE_HANDLERS.get(event['event'], _timeline_row)
+            yield handler(event)
 
     def pr_changedFiles(self, repo, pr_id):
         """ Return changed file list on an issue or a pull request
@@ -647,7 +722,7 @@ class GitHubAPI(object):
         :param pr_id: int,  Pull Request id
         """
         url = "repos/%s/pulls/%s/files" % (repo, pr_id)
-        files = self.request(url, paginate=True, state='all')
+        files = self.request_iter(url, state='all')
         for file in files:
             # print('repo: ' + repo + ' issue: ' + str(issue_id) + ' event: ' + event['event'])
 
@@ -765,6 +840,10 @@ def project_exists(repo_name):
     return bool(requests.head("https://github.com/" + repo_name))
 
 
+_CANONICAL_URL_RE = re.compile(
+    r'^(?:https?://|httpp://)?(?:github\.com)?/?(.*?)(?:\.git)*/?$')
+
+
 @staticmethod
 def canonical_url(project_url):
     # type: (str) -> str
@@ -781,17 +860,9 @@ def canonical_url(project_url):
     >>> GitHubAPI.canonical_url("http://github.com/django/django.git")
     'github.com/django/django'
     >>> GitHubAPI.canonical_url("https://github.com/A/B/")
-    'github.com/a/b/'
+    'github.com/a/b'
     """
-    url = project_url.lower()
-    for chunk in ("httpp://", "https://", "github.com"):
-        if url.startswith(chunk):
-            url = url[len(chunk):]
-    if url.endswith("/"):
-        url = url[:-1]
-    while url.endswith(".git"):
-        url = url[:-4]
-    return "github.com/" + url
+    return "github.com/" + _CANONICAL_URL_RE.match(project_url.lower()).group(1)
 
 
 @staticmethod
@@ -818,12 +889,89 @@ def activity(repo_name):
     return r.json()
 
 
+_V4_FILE_STATUS = {'ADDED': 'added', 'DELETED': 'removed',
+                   'MODIFIED': 'modified', 'RENAMED': 'renamed',
+                   'COPIED': 'copied', 'CHANGED': 'changed'}
+
+_V4_COMMIT_FIELDS = """commit {oid, message, committedDate, authoredDate,
+                               author {name, email, user {login}}
+                               parents (first: %d) {nodes {oid}}
+                               signature {isValid}}"""
+
+
+def _v4_commit_row(commit):
+    """ GraphQL Commit node -> the row GitHubAPI.pull_request_commits yields """
+    author = commit['author'] or {}
+    signature = commit['signature'] or {}
+    return {
+        'sha': commit['oid'],
+        'author': (author.get('user') or {}).get('login'),
+        'author_name': author.get('name'),
+        'author_email': author.get('email'),
+        'authored_date': commit['authoredDate'],
+        'message': commit['message'].replace("\n", ","),
+        'committed_date': commit['committedDate'],
+        'parents': "\n".join(p['oid'] for p in commit['parents']['nodes']),
+        'verified': signature.get('isValid')
+    }
+
+
+def _v4_file_row(repo, sha, file):
+    """ GraphQL PullRequestChangedFile node -> the row
+    GitHubAPI.pr_changedFiles yields. blob/raw/contents urls are built from
+    the head commit, as REST does """
+    return {
+        'filename': file['path'],
+        'status': _V4_FILE_STATUS.get(file['changeType'],
+                                      file['changeType'].lower()),
+        'additions': file['additions'],
+        'deletions': file['deletions'],
+        'changes': file['additions'] + file['deletions'],
+        'blob_url': "https://github.com/%s/blob/%s/%s" % (
+            repo, sha, file['path']),
+        'raw_url': "https://github.com/%s/raw/%s/%s" % (
+            repo, sha, file['path']),
+        'contents_url': GitHubAPIToken.api_url +
+            "repos/%s/contents/%s?ref=%s" % (repo, file['path'], sha)
+    }
+
+
+@lru_cache(maxsize=128)
+def _v4_query_prefix(query):
+    # query texts are fixed, only their variables change from call to call
+    return b'{"query":' + json_dumps(query) + b',"variables":'
+
+
 class GitHubAPIv4(GitHubAPI):
     def v4(self, query, **params):
         # type: (str) -> dict
-        payload = json.dumps({"query": query, "variables": params})
+        payload = _v4_query_prefix(query) + json_dumps(params) + b'}'
         return self.request("graphql", 'post', data=payload)
 
+    def users_info_batch(self, logins, batch_size=100):
+        # type: (Iterable[str], int) -> dict
+        """ Look up many users with one aliased GraphQL query per batch_size
+        logins instead of one /users/:login call each.
+
+        :return: {login: {login, name, email, company, location, createdAt}},
+            None for logins that no longer exist
+        """
+        logins = list(logins)
+        users = {}
+        for start in range(0, len(logins), batch_size):
+            batch = logins[start:start + batch_size]
+            query = "query (%s) {\n%s\n}" % (
+                ", ".join("$l%d: String!" % i for i in range(len(batch))),
+                "\n".join("u%d: user(login: $l%d) "
+                          "{login, name, email, company, location, createdAt}"
+                          % (i, i) for i in range(len(batch))))
+            res = self.v4(query, **{"l%d" % i: login
+                                    for i, login in enumerate(batch)})
+            data = res.get('data') or {}
+            for i, login in enumerate(batch):
+                users[login] = data.get("u%d" % i)
+        return users
+
     def repo_issues(self, repo_name, cursor=None):
         # type: (str, str) -> Iterable[dict]
         owner, repo = repo_name.split("/")
@@ -898,20 +1046,80 @@ class GitHubAPIv4(GitHubAPI):
             if not data["ref"]["target"]["history"]["pageInfo"]["hasNextPage"]:
                 break
 
+    def pull_request_commits(self, repo, pr_id, cursor=None):
+        # type: (str, int, str) -> Iterable[dict]
+        """ Same rows as GitHubAPI.pull_request_commits, 100 commits per
+        GraphQL call """
+        owner, name = repo.split("/")
+        query = """query ($owner: String!, $repo: String!, $number: Int!,
+                          $cursor: String) {
+        repository(name: $repo, owner: $owner) {
+          pullRequest(number: $number) {
+            commits (first: 100, after: $cursor) {
+              nodes {%s}
+              pageInfo {endCursor, hasNextPage}
+        }}}}""" % (_V4_COMMIT_FIELDS % 100)
+
+        while True:
+            data = self.v4(query, owner=owner, repo=name, number=int(pr_id),
+                           cursor=cursor)['data']['repository']
+            if not data or not data["pullRequest"]:
+                break
+
+            commits = data["pullRequest"]["commits"]
+            for node in commits["nodes"]:
+                yield _v4_commit_row(node['commit'])
+
+            cursor = commits["pageInfo"]["endCursor"]
+            if not commits["pageInfo"]["hasNextPage"]:
+                break
+
+    def pr_changedFiles(self, repo, pr_id, cursor=None):
+        # type: (str, int, str) -> Iterable[dict]
+        """ Same rows as GitHubAPI.pr_changedFiles, 100 files per GraphQL
+        call """
+        owner, name = repo.split("/")
+        query = """query ($owner: String!, $repo: String!, $number: Int!,
+                          $cursor: String) {
+        repository(name: $repo, owner: $owner) {
+          pullRequest(number: $number) {
+            headRefOid
+            files (first: 100, after: $cursor) {
+              nodes {path, additions, deletions, changeType}
+              pageInfo {endCursor, hasNextPage}
+        }}}}"""
+
+        while True:
+            data = self.v4(query, owner=owner, repo=name, number=int(pr_id),
+                           cursor=cursor)['data']['repository']
+            if not data or not data["pullRequest"]:
+                break
+
+            sha = data["pullRequest"]["headRefOid"]
+            files = data["pullRequest"]["files"]
+            for file in files["nodes"]:
+                yield _v4_file_row(repo, sha, file)
+
+            cursor = files["pageInfo"]["endCursor"]
+            if not files["pageInfo"]["hasNextPage"]:
+                break
 
 
 def fetch_pr_code_info(repo, pr_id, must_in_local=False):
     global file_list_cache
     ind = (repo, pr_id)
-    if ind in file_list_cache:
-        return file_list_cache[ind]
-
-    path = LOCAL_DATA_PATH + '/pr_data/%s/%s' % (repo, pr_id)
-    # if os.path.exists(path + '/toobig.txt'):
+    path = pr_dir(repo, pr_id)
+    # if os.path.exists(path / 'toobig.txt'):
     #     return []
 
-    raw_diff_path = path + '/raw_diff.json'
-    pull_files_path = path + '/pull_files.json'
+    raw_diff_path = path / 'raw_diff.json'
+    pull_files_path = path / 'pull_files.json'
+    # a refreshed diff or an edited NonCodeFile list invalidates the entry
+    stamp = (_mtime(raw_diff_path), _mtime(pull_files_path),
+             language_tool.language_data_mtime())
+    cached = file_list_cache.get(ind, stamp)
+    if cached is not None:
+        return cached
 
 
     if os.path.exists(raw_diff_path) or os.path.exists(pull_files_path):
@@ -929,19 +1137,15 @@ def fetch_pr_code_info(repo, pr_id, must_in_local=False):
 
     codeOnlyFileList = filterNonCodeFiles(file_list,path)
     if len(codeOnlyFileList) > 0:
-        file_list_cache[ind] = codeOnlyFileList
+        file_list_cache.set(ind, codeOnlyFileList, stamp)
     return codeOnlyFileList
 
 def filterNonCodeFiles(file_list, outfile_prefix):
-    newFileList = []
-    count = 0
-    for f in file_list:
-        if count > 500:
-            localfile.write_to_file(outfile_prefix + "/toobig.txt", '500file')
-            return []
-        if not language_tool.is_text(f['name']):
-            newFileList.append(f)
-            count +=1
+    newFileList = [f for f in file_list
+                   if not language_tool.is_text(f['name'])]
+    if len(newFileList) > 500:
+        localfile.write_to_file(os.path.join(outfile_prefix, "toobig.txt"), '500file')
+        return []
     return newFileList
 
 # -------------------About Repo--------------------------------------------------------
@@ -966,7 +1170,7 @@ def get_repo_PRlist(repo, type, renew):
     else:
         if type == 'branch':
             type = 'branche'
-        ret = api.request('repos/%s/%ss' % (repo, type), True)
+        ret = api.request('repos/%s/%ss' % (repo, type), paginate=True)
 
     localfile.write_to_file(save_path, ret)
     return ret
@@ -993,12 +1197,11 @@ def fetch_commit(url, renew=False):
             pass
 
     c = api.request(url)
-    time.sleep(0.7)
     file_list = []
     for f in c['files']:
         if 'patch' in f:
-            file_list.append(fetch_raw_diff.parse_diff(f['filename'], f['patch']))
-    localfile.write_to_file(save_path, file_list)
+            file_list.append(parse_diff(f['filename'], f['patch']))
+    localfile.write_to_file_later(save_path, file_list)
     return file_list
 
 
@@ -1006,7 +1209,7 @@ def fetch_commit(url, renew=False):
 
 def get_PR(repo, num, renew=False):
     api = GitHubAPI()
-    save_path = LOCAL_DATA_PATH + '/pr_data/%s/%s/api.json' % (repo, num)
+    save_path = pr_dir(repo, num) / 'api.json'
     if os.path.exists(save_path) and (not renew):
         try:
             return localfile.get_file(save_path)
@@ -1014,8 +1217,7 @@ def get_PR(repo, num, renew=False):
             pass
 
     r = api.request('repos/%s/pulls/%s' % (repo, num))
-    time.sleep(3.0)
-    localfile.write_to_file(save_path, r)
+    localfile.write_to_file_later(save_path, r)
     return r
 
 
@@ -1028,7 +1230,7 @@ def concat_commits(commits):
 
 
 def get_pr_commit(repo, pr_id, renew=False):
-    save_path = LOCAL_DATA_PATH + '/pr_data/%s/%s/commits.json' % (repo, pr_id)
+    save_path = pr_dir(repo, pr_id) / 'commits.json'
     commit_url = 'repos/%s/pulls/%s/commits' % (repo, pr_id)
     if os.path.exists(save_path) and (not renew) and (os.stat(save_path).st_size > 2):
         try:
@@ -1039,15 +1241,13 @@ def get_pr_commit(repo, pr_id, renew=False):
     #     commits = api.request(pull['commits_url'].replace('https://api.github.com/', ''), True)
     api = GitHubAPI()
     commits = api.request(commit_url.replace('https://api.github.com/', ''), paginate=True, state='all')
-    time.sleep(0.7)
-    localfile.write_to_file(save_path, commits)
+    localfile.write_to_file_later(save_path, commits)
     return commits
 
 
 def get_another_pull(pull, renew=False):
     api = GitHubAPI()
-    save_path = LOCAL_DATA_PATH + '/pr_data/%s/%s/another_pull.json' % (
-        pull["base"]["repo"]["full_name"], pull["number"])
+    save_path = pr_dir(pull["base"]["repo"]["full_name"], pull["number"]) / 'another_pull.json'
     if os.path.exists(save_path) and (not renew):
         try:
             return localfile.get_file(save_path)
@@ -1055,14 +1255,13 @@ def get_another_pull(pull, renew=False):
             pass
 
     comments_href = pull["_links"]["comments"]["href"]  # found cites in comments, but checking events is easier.
-    comments = api.request(comments_href, True)
-    time.sleep(0.7)
+    comments = api.request(comments_href.replace('https://api.github.com/', ''), paginate=True)
     candidates = []
     for comment in comments:
         candidates.extend(get_pr_and_issue_numbers(comment["body"]))
     candidates.extend(get_pr_and_issue_numbers(pull["body"]))
 
-    result = list(set(candidates))
+    result = list(dict.fromkeys(candidates))
 
     localfile.write_to_file(save_path, result)
     return result
@@ -1072,8 +1271,7 @@ def get_another_pull(pull, renew=False):
 def fetch_file_list(repo, num, renew=False):
     api = GitHubAPI()
     # repo, num = pull["base"]["repo"]["full_name"], str(pull["number"])
-    outfile_prefix = init.local_pr_data_dir + repo + "/" + str(num)
-    save_path = outfile_prefix + '/raw_diff.json'
+    save_path = pr_dir(repo, num) / 'raw_diff.json'
     if os.path.exists(save_path) and (not renew):
         try:
             return localfile.get_file(save_path)
@@ -1082,44 +1280,44 @@ def fetch_file_list(repo, num, renew=False):
     file_list = []
 
     li = api.request('repos/%s/pulls/%s/files' % (repo, num), paginate=True)
-    time.sleep(0.8)
     for f in li:
         if f.get('changes', 0) <= 5000 and ('filename' in f) and ('patch' in f):
-            file_list.append(fetch_raw_diff.parse_diff(f['filename'], f['patch']))
+            file_list.append(parse_diff(f['filename'], f['patch']))
 
-    localfile.write_to_file(save_path, file_list)
+    localfile.write_to_file_later(save_path, file_list)
     return file_list
 
 
-pull_commit_sha_cache = {}
+pull_commit_sha_cache = ShelfCache(LOCAL_DATA_PATH + '/cache/pull_commit_sha')
 
 
 def pull_commit_sha(p):
     index = (p["base"]["repo"]["full_name"], p["number"])
-    if index in pull_commit_sha_cache:
-        return pull_commit_sha_cache[index]
+    # new commits are picked up once commits.json is refreshed
+    stamp = _mtime(pr_dir(*index) / 'commits.json')
+    ret = pull_commit_sha_cache.get(index, stamp)
+    if ret is not None:
+        return ret
     c = get_pr_commit(p)
     ret = [(x["sha"], x["commit"]["author"]["name"]) for x in
            list(filter(lambda x: x["commit"]["author"] is not None, c))]
-    pull_commit_sha_cache[index] = ret
+    pull_commit_sha_cache.set(index, ret, stamp)
     return ret
 
 
+# PRs above these sizes are skipped as too big to compare
+TOO_BIG_CHANGED_FILES = 50
+TOO_BIG_LOC = 10000
+
+
 # This function checks if the PR has changed too many files
 def check_too_big(pull):
-    if not ("changed_files" in pull):
+    if "changed_files" not in pull:
         pull = get_PR(pull["base"]["repo"]["full_name"], pull["number"])
 
-    if not ("changed_files" in pull):
-        pull = get_PR(pull["base"]["repo"]["full_name"], pull["number"], True)
-
-    if pull["changed_files"] > 50:
-        #         print('more than 50 changed files')
-        return True
-    if (pull["additions"] >= 10000) or (pull["deletions"] >= 10000):
-        #         print('more than 10000 Loc changes')
-        return True
-    return False
+    return (pull["changed_files"] > TOO_BIG_CHANGED_FILES
+            or pull["additions"] >= TOO_BIG_LOC
+            or pull["deletions"] >= TOO_BIG_LOC)
 
 
 def text2list_precheck(func):
@@ -1145,20 +1343,13 @@ def get_numbers(text):
 
 @text2list_precheck
 def get_version_numbers(text):
-    nums = [''.join(x) for x in re.findall('(\d+\.)?(\d+\.)(\d+)', text)]
-    nums = list(set(nums))
-    return nums
+    return list(dict.fromkeys(_VERSION_RE.findall(text)))
 
 
 @text2list_precheck
 def get_pr_and_issue_numbers(text):
-    nums = []
-    nums += re.findall('#([0-9]+)', text)
-    nums += re.findall('pull\/([0-9]+)', text)
-    nums += re.findall('issues\/([0-9]+)', text)
-    nums = list(filter(lambda x: len(x) > 0, nums))
-    nums = list(set(nums))
-    return nums
+    return list(dict.fromkeys(num for groups in _REFS_RE.findall(text)
+                              for num in groups if num))
 
 
 
@@ -1177,7 +1368,7 @@ def text2list_precheck(func):
 
 
 def get_pull_commit(pull, renew=False):
-    save_path = LOCAL_DATA_PATH + '/pr_data/%s/%s/commits.json' % (pull["base"]["repo"]["full_name"], pull["number"])
+    save_path = pr_dir(pull["base"]["repo"]["full_name"], pull["number"]) / 'commits.json'
     if os.path.exists(save_path) and (not renew):
         try:
             return localfile.get_file(save_path)
@@ -1185,20 +1376,20 @@ def get_pull_commit(pull, renew=False):
             pass
 
     commits = api.request(pull['commits_url'].replace('https://api.github.com/', ''), paginate=True, state='all')
-    time.sleep(0.7)
-    localfile.write_to_file(save_path, commits)
+    localfile.write_to_file_later(save_path, commits)
     return commits
 
-pull_commit_sha_cache = {}
-
 def pull_commit_sha(p):
     index = (p["base"]["repo"]["full_name"], p["number"])
-    if index in pull_commit_sha_cache:
-        return pull_commit_sha_cache[index]
+    # new commits are picked up once commits.json is refreshed
+    stamp = _mtime(pr_dir(*index) / 'commits.json')
+    ret = pull_commit_sha_cache.get(index, stamp)
+    if ret is not None:
+        return ret
     c = get_pull_commit(p)
     ret = [(x["sha"], x["commit"]["author"]["name"]) for x in
            list(filter(lambda x: x["commit"]["author"] is not None, c))]
-    pull_commit_sha_cache[index] = ret
+    pull_commit_sha_cache.set(index, ret, stamp)
     return ret
 
 
@@ -1206,7 +1397,7 @@ def pull_commit_sha(p):
 
 def fetch_file_list(pull, renew=False):
     repo, num = pull["base"]["repo"]["full_name"], str(pull["number"])
-    save_path = LOCAL_DATA_PATH + '/pr_data/' + repo + '/' + num + '/raw_diff.json'
+    save_path = pr_dir(repo, num) / 'raw_diff.json'
 
     if os.path.exists(save_path) and (not renew):
         try:
@@ -1222,12 +1413,11 @@ def fetch_file_list(pull, renew=False):
     else:
         li = api.request('repos/%s/pulls/%s/files' % (repo, num), paginate=True)
         # li = api.request( 'repos/%s/pulls/%s/files' % (repo, num), True)
-        time.sleep(0.8)
         for f in li:
             if f.get('changes', 0) <= 5000 and ('filename' in f) and ('patch' in f):
                 file_list.append(parse_diff(f['filename'], f['patch']))
 
-    localfile.write_to_file(save_path, file_list)
+    localfile.write_to_file_later(save_path, file_list)
     return file_list
 
 def allNonCodeFiles(pull):
@@ -1240,23 +1430,15 @@ def allNonCodeFiles(pull):
         return True
         # raise Exception('too big', pull['html_url'])
 
-    total_num_files = len(file_list)
-    noncode_file_count = 0
-    for file in file_list:
-        for extension in nonCodeFileExtensionList:
-            if file['name'].endswith(extension):
-                noncode_file_count += 1
-        if (noncode_file_count == total_num_files):
-            return True
-        else:
-            return False
+    return bool(file_list) and all(
+        file['name'].endswith(nonCodeFileSuffixes) for file in file_list)
 
 
 
 # ------------------About Pull Requests----------------------------------------------------
 
 def get_PR(repo, num, renew=False):
-    save_path = LOCAL_DATA_PATH + '/pr_data/%s/%s/api.json' % (repo, num)
+    save_path = pr_dir(repo, num) / 'api.json'
     if os.path.exists(save_path) and (not renew):
         try:
             return localfile.get_file(save_path)
@@ -1264,13 +1446,12 @@ def get_PR(repo, num, renew=False):
             pass
 
     r = api.request('repos/%s/pulls/%s' % (repo, num))
-    time.sleep(3.0)
-    localfile.write_to_file(save_path, r)
+    localfile.write_to_file_later(save_path, r)
     return r
 
 
 def get_pull_commit(pull, renew=False):
-    save_path = LOCAL_DATA_PATH + '/pr_data/%s/%s/commits.json' % (pull["base"]["repo"]["full_name"], pull["number"])
+    save_path = pr_dir(pull["base"]["repo"]["full_name"], pull["number"]) / 'commits.json'
     if os.path.exists(save_path) and (not renew):
         try:
             return localfile.get_file(save_path)
@@ -1281,20 +1462,14 @@ def get_pull_commit(pull, renew=False):
 
     commits = api.request(pull['commits_url'].replace('https://api.github.com/', ''), paginate=True, state='all')
     # commits = api.request(pull['commits_url'].replace('https://api.github.com/', paginate=True, state='all'))
-    time.sleep(0.7)
-    localfile.write_to_file(save_path, commits)
+    localfile.write_to_file_later(save_path, commits)
     return commits
 
 
 @text2list_precheck
 def get_pr_and_issue_numbers(text):
-    nums = []
-    nums += re.findall('#([0-9]+)', text)
-    nums += re.findall('pull\/([0-9]+)', text)
-    nums += re.findall('issues\/([0-9]+)', text)
-    nums = list(filter(lambda x: len(x) > 0, nums))
-    nums = list(set(nums))
-    return nums
+    return list(dict.fromkeys(num for groups in _REFS_RE.findall(text)
+                              for num in groups if num))
 
 
 
@@ -24,6 +24,12 @@ else:
 
 mysqlParam = "./input/mysqlParams.txt"
 
+# GitHub API response cache (LOCAL_DATA_PATH/cache/api_responses.sqlite):
+# 'enabled' revalidates cached responses with ETags and drops ones unused for
+# 30 days, 'replay' serves them without touching the network (requests that
+# were never cached raise response_cache.NotCached), 'disabled' bypasses it
+response_cache_mode = 'enabled'
+
 # print('monitored_repoList_filePath:' + monitored_repoList_filePath)
 # print('LOCAL_DATA_PATH:' + LOCAL_DATA_PATH)
 # print('PR_candidate_List_filePath_prefix:' + PR_candidate_List_filePath_prefix)
\ No newline at end of file
@@ -0,0 +1,15 @@
+""" Bundle the word lists under util/language into language_data.pkl, which
+language_tool.init() loads with a single read. Rerun after editing any of the
+.txt files:
+
+    python -m util.build_language_data
+"""
+import pickle
+
+from util import language_tool
+
+if __name__ == "__main__":
+    with open(language_tool.language_pickle_path, 'wb') as write_file:
+        pickle.dump(language_tool.read_language_data(), write_file,
+                    pickle.HIGHEST_PROTOCOL)
+    print('finish write %s to file....' % language_tool.language_pickle_path)
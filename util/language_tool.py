@@ -1,36 +1,69 @@
 import os
+import pickle
 
 FLAGS_load_language_data = False
 
-text_suffix = []
+text_suffix = frozenset()
 general_stopwords = []
-Non_Code_suffix = []
+Non_Code_suffix = frozenset()
 PL_reserved_words = []
 language_data_path = os.path.dirname(os.path.realpath(__file__)) + '/language'
+language_pickle_path = language_data_path + '/language_data.pkl'
+language_source_files = ['text_suffix.txt', 'NonCodeFile.txt',
+                         'general_stopwords.txt', 'PLReservedWords.txt']
 
-def init():
-    """ Load the language data.
+def read_language_data():
+    """ Read the word lists from the .txt files under language_data_path.
+        Returns:
+            (text_suffix, Non_Code_suffix, general_stopwords, PL_reserved_words)
     """
-    global FLAGS_load_language_data
-    if FLAGS_load_language_data:
-        return
+    # suffix tables are only used for membership tests
     with open(language_data_path + '/text_suffix.txt') as read_file:
-        for line in read_file.readlines():
-            text_suffix.append(line.strip())
+        text_suffix = frozenset(line.strip() for line in read_file)
     with open(language_data_path + '/NonCodeFile.txt') as read_file:
-        for line in read_file.readlines():
-            Non_Code_suffix.append(line.strip())
-
+        Non_Code_suffix = frozenset(line.strip() for line in read_file)
     with open(language_data_path + '/general_stopwords.txt') as read_file:
-        for line in read_file.readlines():
-            if line:
-                word = line.strip()
-                general_stopwords.append(word)
+        general_stopwords = [line.strip() for line in read_file if line]
     with open(language_data_path + '/PLReservedWords.txt') as read_file:
-        for line in read_file.readlines():
-            if line:
-                word = line.strip()
-                PL_reserved_words.append(word)
+        PL_reserved_words = [line.strip() for line in read_file if line]
+    return text_suffix, Non_Code_suffix, general_stopwords, PL_reserved_words
+
+def language_data_mtime():
+    """ Latest modification time of the .txt word lists, None if one of them
+    is missing. Results derived from the lists can be stamped with it.
+    """
+    try:
+        return max(os.path.getmtime(language_data_path + '/' + name)
+                   for name in language_source_files)
+    except OSError:
+        return None
+
+def pickle_is_fresh():
+    """ language_data.pkl exists and is no older than any of the .txt files
+    it was built from, so edited word lists are never shadowed by it.
+    """
+    source_mtime = language_data_mtime()
+    try:
+        return source_mtime is not None and \
+            os.path.getmtime(language_pickle_path) >= source_mtime
+    except OSError:
+        return False
+
+def init():
+    """ Load the language data, from language_data.pkl when it was built
+    (python -m util.build_language_data) after the last edit to the .txt
+    files, else from the .txt files.
+    """
+    global FLAGS_load_language_data, text_suffix, Non_Code_suffix, \
+        general_stopwords, PL_reserved_words
+    if FLAGS_load_language_data:
+        return
+    if pickle_is_fresh():
+        with open(language_pickle_path, 'rb') as read_file:
+            data = pickle.load(read_file)
+    else:
+        data = read_language_data()
+    text_suffix, Non_Code_suffix, general_stopwords, PL_reserved_words = data
 
     FLAGS_load_language_data = True
 
@@ -55,13 +88,7 @@ def is_text(file):
     if '.' not in file:
         return True
     file_name, file_suffix = os.path.splitext(file)
-    file_suffix = file_suffix.strip()
-    if '.gitignore' in file_name:
-        return True
-    if file_suffix in Non_Code_suffix:
-        return True
-    else:
-        return False
+    return '.gitignore' in file_name or file_suffix.strip() in Non_Code_suffix
 
 
 if __name__ == "__main__":
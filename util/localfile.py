@@ -1,5 +1,28 @@
 import os
 import json
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # optional, several times faster on the large PR and commit lists
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# single background writer for write_to_file_later; its queue is drained
+# before the interpreter exits
+_writer = ThreadPoolExecutor(max_workers=1)
 
 
 def write_to_file(file, obj):
@@ -12,45 +35,71 @@ def write_to_file(file, obj):
     Return:
         none
     """
-    path = os.path.dirname(file)
-    if not os.path.exists(path):
-        os.makedirs(path)
-    with open(file, 'w') as write_file:
-        write_file.write(json.dumps(obj))
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'wb') as write_file:
+        write_file.write(_dumps(obj))
     print('finish write %s to file....' % file)
 
 
+def _write_bytes(file, data):
+    file = os.fspath(file)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    # readers see either the old file or the complete new one
+    with open(file + '.tmp', 'wb') as write_file:
+        write_file.write(data)
+    os.replace(file + '.tmp', file)
+    print('finish write %s to file....' % file)
+
+
+def _log_write_error(file, future):
+    # nobody waits on the futures of write_to_file_later, so failures have
+    # to be reported here or they are lost
+    e = future.exception()
+    if e is not None:
+        logger.error('error on write %s to file: %s', file, e)
+
+
+def write_to_file_later(file, obj):
+    """ Same as write_to_file, but the disk write happens on a background
+    writer thread so the caller can go on with its next request.
+    obj is serialized right away, later changes to it are not written.
+    Args:
+        file: the file's path, like : ./tmp/INFOX/repo_info.json
+        obj: the instance to be written into file (can be list, dict)
+    Return:
+        a Future that completes once the file is written; a failed write
+        is logged as an error
+    """
+    future = _writer.submit(_write_bytes, file, _dumps(obj))
+    future.add_done_callback(functools.partial(_log_write_error, file))
+    return future
+
+
 def replaceWithNewPRs(file, obj):
-    new_prid_list = []
-    newPR_map = {}
-    for i in range(len(obj)):
-        new_prid_list.append(obj[i]['number'])
-        newPR_map[obj[i]['number']] = obj[i]
-
-    old_prid_list = []
-    with open(file) as json_file:
-        old_data = json.load(json_file)
-        for i in range(len(old_data)):
-            id = old_data[i]['number']
-            old_prid_list.append(id)
-            if (id in new_prid_list):
-                old_data[i] = newPR_map.get(id)
-                new_prid_list.remove(id)
-        for id in new_prid_list:
-            old_data.insert(0,newPR_map.get(id))
-
-    path = os.path.dirname(file)
-    if not os.path.exists(path):
-        os.makedirs(path)
-    with open(file, 'w') as write_file:
-        write_file.write(json.dumps(old_data))
+    newPR_map = {pr['number']: pr for pr in obj}
+
+    with open(file, 'rb') as json_file:
+        old_data = _loads(json_file.read())
+    replaced = set()
+    for i, pr in enumerate(old_data):
+        id = pr['number']
+        if id in newPR_map:
+            old_data[i] = newPR_map[id]
+            replaced.add(id)
+    # PRs not in the file yet go on top, last new PR first
+    old_data[:0] = [pr for id, pr in reversed(list(newPR_map.items()))
+                    if id not in replaced]
+
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'wb') as write_file:
+        write_file.write(_dumps(old_data))
     print('finish write %s to file....' % file)
 
 
 def get_file(path):
     if os.path.exists(path):
-        with open(path) as f:
-            result = json.load(f)
+        with open(path, 'rb') as f:
+            result = _loads(f.read())
         return result
     else:
         raise Exception('no such file %s' % path)
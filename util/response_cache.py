@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+try:
+    # optional, several times faster on large cached bodies
+    from orjson import loads as _loads, dumps as _dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+ENABLED = 'enabled'
+REPLAY = 'replay'
+DISABLED = 'disabled'
+
+
+class NotCached(LookupError):
+    """ Raised in replay mode for a request that has no cached response """
+    pass
+
+
+class ResponseCache(object):
+    """ Persistent cache of GitHub API responses keyed by (url, params).
+    Stored bodies are revalidated with If-None-Match / If-Modified-Since;
+    GitHub answers unchanged resources with 304, which is not counted
+    against the rate limit.
+
+    Modes:
+        enabled: revalidate cached entries, store fresh responses
+        replay: serve cached entries without touching the network
+        disabled: bypass the cache entirely
+
+    Entries not fetched or revalidated for max_age seconds are dropped when
+    the cache is opened in enabled mode; replay keeps everything.
+    """
+
+    def __init__(self, path, mode=ENABLED, max_age=30 * 24 * 3600):
+        self.path = path
+        self.mode = mode
+        self.max_age = max_age
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # opened lazily so that importing the crawler does not touch disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # with WAL, commits no longer wait for an fsync each
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                'link TEXT, body TEXT, fetched_at REAL)')
+            if self.mode == ENABLED:
+                self._conn.execute(
+                    'DELETE FROM responses WHERE fetched_at < ?',
+                    (time.time() - self.max_age,))
+                self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def key(url, params):
+        raw = url + json.dumps(sorted(params.items()), default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, url, params, body=False):
+        """ Return the cached entry as a dict with etag, last_modified and
+        link, or None if the cache is disabled or has no entry.
+        The stored body is only read and decoded, into the 'body' key, when
+        body is True; revalidation needs just the validators.
+        """
+        if self.mode == DISABLED:
+            return None
+        columns = 'etag, last_modified, link, body' if body else \
+            'etag, last_modified, link'
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT %s FROM responses WHERE key = ?' % columns,
+                (self.key(url, params),)).fetchone()
+        if row is None:
+            return None
+        entry = {
+            'etag': row[0],
+            'last_modified': row[1],
+            'link': row[2],
+        }
+        if body:
+            entry['body'] = _loads(row[3])
+        return entry
+
+    def put(self, url, params, response, body):
+        """ Store body if the response carries a validator to revalidate it
+        with later.
+        """
+        if self.mode == DISABLED:
+            return
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (self.key(url, params), etag, last_modified,
+                 response.headers.get('Link', ''), _dumps(body),
+                 time.time()))
+            conn.commit()
+
+    def touch(self, url, params):
+        """ Mark the entry as revalidated now, so it is not evicted while
+        GitHub keeps answering 304 for it.
+        """
+        if self.mode != ENABLED:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'UPDATE responses SET fetched_at = ? WHERE key = ?',
+                (time.time(), self.key(url, params)))
+            conn.commit()
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
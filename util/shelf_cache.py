@@ -0,0 +1,93 @@
+import os
+import atexit
+import shelve
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+def _try_lock(lock_file):
+    # non-blocking exclusive lock, held until lock_file is closed
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class ShelfCache(object):
+    """ Cache persisted to a shelve file, so values computed in one run
+    (parsed diffs, commit shas) are served to the next without re-reading
+    and re-parsing the per-PR JSON files.
+
+    Keys are tuples such as (repo, pr_id) and are stored as 'part/part'
+    strings. Every value is stored with a stamp, e.g. the mtime of the file
+    it was derived from, and get() only returns it while the caller's stamp
+    still matches, so a refreshed source file invalidates the entry.
+
+    The shelf is held under an exclusive lock on a '.lock' file next to it.
+    If the lock is taken by another crawler process, or the shelf cannot be
+    opened, this process caches in a plain in-memory dict instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._shelf = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # opened lazily so that importing the crawler does not touch disk
+        if self._shelf is None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._lock_file = open(self.path + '.lock', 'a+b')
+                if not _try_lock(self._lock_file):
+                    raise OSError('locked by another process')
+                self._shelf = shelve.open(self.path, writeback=False)
+                atexit.register(self.close)
+            except Exception as e:
+                logger.warning('cannot open %s (%s), caching in memory only',
+                               self.path, e)
+                if self._lock_file is not None:
+                    self._lock_file.close()
+                    self._lock_file = None
+                self._shelf = {}
+        return self._shelf
+
+    @staticmethod
+    def key(key):
+        return '/'.join(str(part) for part in key)
+
+    def get(self, key, stamp=None):
+        """ The value stored for key with this stamp, None otherwise """
+        with self._lock:
+            entry = self._open().get(self.key(key))
+        # entries written before stamps were kept are plain values
+        if isinstance(entry, tuple) and len(entry) == 2 and \
+                entry[0] == stamp:
+            return entry[1]
+        return None
+
+    def set(self, key, value, stamp=None):
+        with self._lock:
+            self._open()[self.key(key)] = (stamp, value)
+
+    def close(self):
+        with self._lock:
+            if self._shelf is not None and hasattr(self._shelf, 'close'):
+                self._shelf.close()
+            self._shelf = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None